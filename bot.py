@@ -16,6 +16,12 @@ import shutil
 import hashlib
 import re
 import threading
+import ctypes
+import fcntl
+import platform
+import resource
+import mmap
+from collections import OrderedDict
 from pathlib import Path
 from typing import Dict, Tuple, Optional, List
 
@@ -29,6 +35,74 @@ MAX_DOWNLOAD_SIZE = 50 * 1024 * 1024  # 50MB
 COMMAND_TIMEOUT = 600  # 10 minutes
 MAX_MESSAGE_LENGTH = 4000
 
+# Output rendering and pagination
+OUTPUT_PAGE_LENGTH = 3500  # Rendered characters per page, leaves room for header and tags
+OUTPUT_MAX_PAGES = 200  # Pages kept per output, longer output is also sent as a file
+# An entry holds at most OUTPUT_MAX_PAGES * OUTPUT_PAGE_LENGTH characters (under 3MB
+# of UTF-8), so keep the cache budget above that or new entries evict themselves
+OUTPUT_CACHE_SIZE = 50  # Paginated command outputs kept for Prev/Next navigation
+OUTPUT_CACHE_MAX_BYTES = 16 * 1024 * 1024  # UTF-8 size of all cached pages
+
+# Escape tables for str.translate, one lookup per character instead of a generator join
+MARKDOWN_ESCAPE_TABLE = str.maketrans({c: f'\\{c}' for c in '_*~`>#+-=|{}.!'})
+MARKDOWN_V2_ESCAPE_TABLE = str.maketrans({c: f'\\{c}' for c in '\\_*[]()~`>#+-=|{}.!'})
+MARKDOWN_V2_CODE_ESCAPE_TABLE = str.maketrans({'\\': '\\\\', '`': '\\`'})
+HTML_ESCAPE_TABLE = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;'})
+# Escaping inside preformatted blocks, legacy Markdown keeps escape_markdown's behaviour
+CODE_ESCAPE_TABLES = {
+    'HTML': HTML_ESCAPE_TABLE,
+    'MarkdownV2': MARKDOWN_V2_CODE_ESCAPE_TABLE,
+    'Markdown': MARKDOWN_ESCAPE_TABLE
+}
+MAX_ESCAPE_EXPANSION = {'HTML': 5, 'MarkdownV2': 2, 'Markdown': 2}
+
+# Content-addressed upload store
+BLOB_STORE_DIR = os.path.join(os.getcwd(), 'bot_blobs')
+BLOB_STORE_QUOTA = 1024 * 1024 * 1024  # 1GB, least recently used blobs are evicted first
+# Opt-in: hardlinked uploads share one inode, so an in-place edit of any copy changes all of them
+BLOB_STORE_HARDLINKS = False
+FICLONE = 0x40049409  # ioctl cloning a whole file on copy-on-write filesystems
+
+# Paged file viewer
+VIEW_PAGE_SIZE = 1800  # Bytes per page before escaping
+MAX_VIEW_SESSIONS = 20  # Open file mappings kept for Prev/Next paging
+TAIL_DEFAULT_LINES = 20
+TAIL_MAX_LINES = 500
+GREP_MAX_MATCHES = 50
+GREP_MAX_LINE_LENGTH = OUTPUT_PAGE_LENGTH // MAX_ESCAPE_EXPANSION['HTML']
+
+# Resource limits for spawned commands, per command class
+#   nice          - scheduling niceness added to the child
+#   ionice        - (class, level): 1 realtime, 2 best-effort, 3 idle
+#   oom_score_adj - makes the kernel OOM killer prefer the child over the bot
+#   rlimits       - resource.setrlimit values, e.g. {'RLIMIT_AS': 2 * 1024 ** 3}
+#   cgroup        - cgroup v2 interface files, e.g. {'memory.max': 1024 ** 3, 'cpu.max': '50000 100000'}
+COMMAND_LIMITS = {
+    'shell': {
+        'nice': 10, 'ionice': (2, 7), 'oom_score_adj': 500,
+        'rlimits': {}, 'cgroup': {'cpu.weight': 100, 'pids.max': 1024}
+    },
+    'background': {
+        'nice': 15, 'ionice': (3, 0), 'oom_score_adj': 800,
+        'rlimits': {}, 'cgroup': {'cpu.weight': 50, 'pids.max': 1024}
+    },
+    'bot_script': {
+        'nice': 5, 'ionice': (2, 4), 'oom_score_adj': 300,
+        'rlimits': {}, 'cgroup': {'cpu.weight': 100, 'pids.max': 256}
+    },
+}
+# Per-user overrides merged over COMMAND_LIMITS: {user_id: {'shell': {'rlimits': {...}}}}
+USER_COMMAND_LIMITS = {}
+
+# Optional cgroup v2 isolation, built below the cgroup the bot was started in
+# (e.g. its systemd unit, which needs Delegate=yes for the bot to manage it)
+CGROUP_ENABLED = False
+CGROUP_ROOT = '/sys/fs/cgroup'
+BOT_CPU_WEIGHT = 1000  # Reserved share for the bot itself, command groups use lower weights
+BOT_OOM_SCORE_ADJ = -500
+
+IOPRIO_SYSCALLS = {'x86_64': 251, 'aarch64': 30, 'i386': 289, 'i686': 289, 'armv7l': 314}
+
 # Emojis for better UX
 EMOJIS = {
     'robot': '🤖', 'folder': '📁', 'file': '📄', 'upload': '📤',
@@ -46,11 +120,24 @@ class TelegramBot:
         self.user_directories = {}
         self.running_processes = {}
         self.running_bots = {}
+        self.view_sessions = OrderedDict()
+        self.next_view_session_id = 0
+        self.output_cache = OrderedDict()
+        self.output_cache_bytes = 0
+        self.next_output_id = 0
         
         # Create necessary directories
         self.scripts_dir = os.path.join(os.getcwd(), 'bot_scripts')
         self.temp_dir = tempfile.mkdtemp(prefix='telegram_bot_')
+        self.blob_dir = BLOB_STORE_DIR
+        self.blob_index_path = os.path.join(self.blob_dir, 'index.json')
         self._ensure_directories()
+        self.blob_index = self._load_blob_index()
+        
+        # Resource isolation for spawned commands
+        self._ioprio_syscall = self._resolve_ioprio_syscall()
+        self.command_cgroups = {}
+        self.cgroup_base = self._reserve_bot_resources()
         
         # Install dependencies on startup
         self._install_dependencies()
@@ -71,6 +158,7 @@ class TelegramBot:
         """Ensure necessary directories exist"""
         try:
             os.makedirs(self.scripts_dir, exist_ok=True)
+            os.makedirs(self.blob_dir, exist_ok=True)
         except Exception as e:
             self.logger.error(f"Failed to create directories: {e}")
     
@@ -93,11 +181,165 @@ class TelegramBot:
     
     def escape_markdown(self, text: str) -> str:
         """Escape special characters for Telegram markdown formatting"""
-        escape_chars = r'_*~`>#+-=|{}.!'
-        return ''.join(f'\\{c}' if c in escape_chars else c for c in text)
+        return text.translate(MARKDOWN_ESCAPE_TABLE)
+    
+    def escape_text(self, text: str, parse_mode: str = 'HTML') -> str:
+        """Escape plain text for the given Telegram parse mode"""
+        if parse_mode == 'HTML':
+            return text.translate(HTML_ESCAPE_TABLE)
+        if parse_mode == 'MarkdownV2':
+            return text.translate(MARKDOWN_V2_ESCAPE_TABLE)
+        if parse_mode == 'Markdown':
+            return self.escape_markdown(text)
+        raise ValueError(f"Unsupported parse mode: {parse_mode}")
+    
+    def format_code_block(self, text: str, parse_mode: str = 'HTML', escaped: bool = False) -> str:
+        """Wrap text in a preformatted block for the given parse mode"""
+        if parse_mode not in CODE_ESCAPE_TABLES:
+            raise ValueError(f"Unsupported parse mode: {parse_mode}")
+        if not escaped:
+            text = text.translate(CODE_ESCAPE_TABLES[parse_mode])
+        if parse_mode == 'HTML':
+            return f"<pre>{text}</pre>"
+        return f"```\n{text}\n```"
+    
+    def paginate_output(self, text: str, parse_mode: str = 'HTML',
+                        max_pages: int = OUTPUT_MAX_PAGES) -> Tuple[List[str], bool]:
+        """Split output into pre-escaped pages that fit a single message
+
+        Renders at most max_pages pages and reports whether output was cut.
+        """
+        if parse_mode not in CODE_ESCAPE_TABLES:
+            raise ValueError(f"Unsupported parse mode: {parse_mode}")
+        
+        # Pages never hold more than OUTPUT_PAGE_LENGTH characters, so nothing
+        # past this point could fit and it is never split or escaped
+        max_length = max_pages * OUTPUT_PAGE_LENGTH
+        truncated = len(text) > max_length
+        text = text[:max_length]
+        
+        table = CODE_ESCAPE_TABLES[parse_mode]
+        chunk_size = OUTPUT_PAGE_LENGTH // MAX_ESCAPE_EXPANSION[parse_mode]
+        pages = []
+        current = []
+        current_length = 0
+        
+        for line in text.split('\n'):
+            # Split overlong lines before escaping so entities are never cut in half
+            if len(line) > chunk_size:
+                pieces = [line[i:i + chunk_size] for i in range(0, len(line), chunk_size)]
+            else:
+                pieces = [line]
+            
+            for piece in pieces:
+                escaped = piece.translate(table)
+                if current and current_length + len(escaped) + 1 > OUTPUT_PAGE_LENGTH:
+                    pages.append('\n'.join(current))
+                    if len(pages) >= max_pages:
+                        return pages, True
+                    current = []
+                    current_length = 0
+                current.append(escaped)
+                current_length += len(escaped) + 1
+        
+        if current:
+            pages.append('\n'.join(current))
+        return pages or [''], truncated
+    
+    def _cache_output(self, user_id: int, command: str, pages: List[str], truncated: bool) -> int:
+        """Store rendered output pages in the bounded LRU cache"""
+        # Entry size is already bounded by OUTPUT_MAX_PAGES in paginate_output
+        size = sum(len(page.encode('utf-8')) for page in pages)
+        output_id = self.next_output_id
+        self.next_output_id += 1
+        self.output_cache[output_id] = {
+            'user_id': user_id, 'command': command, 'pages': pages,
+            'size': size, 'truncated': truncated
+        }
+        self.output_cache_bytes += size
+        
+        while len(self.output_cache) > OUTPUT_CACHE_SIZE or self.output_cache_bytes > OUTPUT_CACHE_MAX_BYTES:
+            _, oldest = self.output_cache.popitem(last=False)
+            self.output_cache_bytes -= oldest['size']
+        
+        return output_id
+    
+    def _render_output_page(self, output_id: int, entry: dict, page: int) -> Tuple[str, Optional[dict]]:
+        """Render a cached output page and its Prev/Next keyboard"""
+        pages = entry['pages']
+        command = entry['command']
+        if len(command) > 60:
+            command = command[:57] + '...'
+        header = f"{EMOJIS['terminal']} <code>{self.escape_text(command)}</code> page {page + 1}/{len(pages)}"
+        text = f"{header}\n{self.format_code_block(pages[page], escaped=True)}"
+        if entry['truncated'] and page == len(pages) - 1:
+            text += f"\n{EMOJIS['warning']} <i>Output truncated, full output was sent as a file</i>"
+        
+        buttons = []
+        if page > 0:
+            buttons.append({'text': '◀️ Prev', 'callback_data': f"out:{output_id}:{page - 1}"})
+        if page < len(pages) - 1:
+            buttons.append({'text': 'Next ▶️', 'callback_data': f"out:{output_id}:{page + 1}"})
+        return text, {'inline_keyboard': [buttons]} if buttons else None
+    
+    def send_command_output(self, chat_id: int, user_id: int, command: str, output: str):
+        """Send command output, paginating it through the output cache when long"""
+        pages, truncated = self.paginate_output(output)
+        if len(pages) == 1 and not truncated:
+            self.send_message(chat_id, self.format_code_block(pages[0], escaped=True), parse_mode='HTML')
+            return
+        
+        output_id = self._cache_output(user_id, command, pages, truncated)
+        entry = self.output_cache[output_id]
+        text, keyboard = self._render_output_page(output_id, entry, 0)
+        self.send_message(chat_id, text, parse_mode='HTML', reply_markup=keyboard)
+        
+        if entry['truncated']:
+            self._send_output_document(chat_id, output)
+    
+    def _send_output_document(self, chat_id: int, output: str):
+        """Send the complete output of a command as a text file"""
+        data = output.encode('utf-8', errors='replace')
+        if len(data) > MAX_DOWNLOAD_SIZE:
+            size_mb = len(data) / (1024 * 1024)
+            self.send_message(chat_id, f"{EMOJIS['warning']} Full output too large to send: {size_mb:.1f}MB (max 50MB)")
+            return
+        
+        output_path = os.path.join(self.temp_dir, f"output_{int(time.time() * 1000)}.txt")
+        try:
+            with open(output_path, 'wb') as f:
+                f.write(data)
+            result = self.send_document(chat_id, output_path, f"{EMOJIS['file']} Full command output")
+            if not result or not result.get('ok'):
+                self.send_message(chat_id, f"{EMOJIS['error']} Failed to send full output")
+        except Exception as e:
+            self.logger.error(f"Failed to send output document: {e}")
+        finally:
+            try:
+                os.remove(output_path)
+            except OSError:
+                pass
+    
+    def handle_output_callback(self, callback_query: dict, output_id: int, page: int):
+        """Handle Prev/Next buttons of paginated command output"""
+        message = callback_query['message']
+        entry = self.output_cache.get(output_id)
+        if not entry or entry['user_id'] != callback_query['from']['id']:
+            self.answer_callback_query(callback_query['id'], "Output expired, run the command again")
+            return
+        if not 0 <= page < len(entry['pages']):
+            self.answer_callback_query(callback_query['id'])
+            return
+        
+        self.output_cache.move_to_end(output_id)
+        text, keyboard = self._render_output_page(output_id, entry, page)
+        self.edit_message_text(message['chat']['id'], message['message_id'], text,
+                               parse_mode='HTML', reply_markup=keyboard)
+        self.answer_callback_query(callback_query['id'])
     
     def send_message(self, chat_id: int, text: str, parse_mode: str = 'Markdown', 
-                    reply_to_message_id: Optional[int] = None) -> Optional[dict]:
+                    reply_to_message_id: Optional[int] = None,
+                    reply_markup: Optional[dict] = None) -> Optional[dict]:
         """Send message to Telegram chat"""
         url = f"{self.base_url}/sendMessage"
         data = {
@@ -108,6 +350,8 @@ class TelegramBot:
         
         if reply_to_message_id:
             data['reply_to_message_id'] = reply_to_message_id
+        if reply_markup:
+            data['reply_markup'] = reply_markup
         
         try:
             # Handle long messages
@@ -145,6 +389,39 @@ class TelegramBot:
             self.send_message(chat_id, chunk, parse_mode, reply_id)
             time.sleep(0.5)
     
+    def edit_message_text(self, chat_id: int, message_id: int, text: str, parse_mode: str = 'Markdown',
+                          reply_markup: Optional[dict] = None) -> Optional[dict]:
+        """Replace the text of a previously sent message"""
+        url = f"{self.base_url}/editMessageText"
+        data = {
+            'chat_id': chat_id,
+            'message_id': message_id,
+            'text': text,
+            'parse_mode': parse_mode
+        }
+        
+        if reply_markup:
+            data['reply_markup'] = reply_markup
+        
+        try:
+            response = requests.post(url, json=data, timeout=30)
+            return response.json()
+        except Exception as e:
+            self.logger.error(f"Error editing message: {e}")
+            return None
+    
+    def answer_callback_query(self, callback_query_id: str, text: Optional[str] = None):
+        """Acknowledge an inline keyboard button press"""
+        url = f"{self.base_url}/answerCallbackQuery"
+        data = {'callback_query_id': callback_query_id}
+        if text:
+            data['text'] = text
+        
+        try:
+            requests.post(url, json=data, timeout=10)
+        except Exception as e:
+            self.logger.error(f"Error answering callback query: {e}")
+    
     def send_document(self, chat_id: int, file_path: str, caption: Optional[str] = None) -> Optional[dict]:
         """Send document to Telegram chat"""
         url = f"{self.base_url}/sendDocument"
@@ -189,6 +466,175 @@ class TelegramBot:
         except Exception as e:
             return False, f"Error downloading file: {e}"
     
+    def _load_blob_index(self) -> dict:
+        """Load the upload store index from disk"""
+        try:
+            with open(self.blob_index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            index.setdefault('blobs', {})
+            index.setdefault('file_ids', {})
+            return index
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            self.logger.warning(f"Failed to load blob index, starting empty: {e}")
+        return {'blobs': {}, 'file_ids': {}}
+    
+    def _save_blob_index(self):
+        """Atomically persist the upload store index"""
+        tmp_path = self.blob_index_path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.blob_index, f)
+            os.replace(tmp_path, self.blob_index_path)
+        except Exception as e:
+            self.logger.error(f"Failed to save blob index: {e}")
+    
+    def _blob_path(self, digest: str) -> str:
+        """Get on-disk path of a blob by its SHA-256 digest"""
+        return os.path.join(self.blob_dir, digest[:2], digest)
+    
+    def _blob_is_valid(self, digest: str) -> bool:
+        """Check that a blob still exists and was not modified through a hardlink"""
+        entry = self.blob_index['blobs'].get(digest)
+        if not entry:
+            return False
+        try:
+            st = os.stat(self._blob_path(digest))
+        except OSError:
+            return False
+        return st.st_size == entry['size'] and st.st_mtime_ns == entry['mtime_ns']
+    
+    def _drop_blob(self, digest: str):
+        """Remove a blob and every file_unique_id pointing at it"""
+        self.blob_index['blobs'].pop(digest, None)
+        self.blob_index['file_ids'] = {
+            unique_id: d for unique_id, d in self.blob_index['file_ids'].items() if d != digest
+        }
+        try:
+            os.remove(self._blob_path(digest))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            self.logger.warning(f"Failed to remove blob {digest}: {e}")
+    
+    def _store_blob(self, temp_path: str, file_unique_id: Optional[str]) -> str:
+        """Move a downloaded file into the store and return its digest"""
+        sha256 = hashlib.sha256()
+        with open(temp_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+        digest = sha256.hexdigest()
+        blob_path = self._blob_path(digest)
+        
+        if self._blob_is_valid(digest):
+            # Same content already stored under another file_unique_id
+            os.remove(temp_path)
+        else:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(temp_path, blob_path)
+            st = os.stat(blob_path)
+            self.blob_index['blobs'][digest] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+        
+        self.blob_index['blobs'][digest]['last_used'] = time.time()
+        if file_unique_id:
+            self.blob_index['file_ids'][file_unique_id] = digest
+        return digest
+    
+    def _clone_file(self, source: str, destination: str) -> bool:
+        """Copy-on-write clone, only succeeds on filesystems like btrfs or xfs"""
+        try:
+            with open(source, 'rb') as src, open(destination, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return True
+        except OSError:
+            # Never leave the empty file behind, it would block the hardlink fallback
+            try:
+                os.remove(destination)
+            except OSError:
+                pass
+            return False
+    
+    def _link_blob(self, digest: str, destination: str) -> str:
+        """Place a blob at destination via reflink, opt-in hardlink or plain copy"""
+        blob_path = self._blob_path(digest)
+        if os.path.lexists(destination):
+            if (BLOB_STORE_HARDLINKS and os.path.exists(destination)
+                    and os.path.samefile(blob_path, destination)):
+                return "hardlink"
+            os.remove(destination)
+        
+        if self._clone_file(blob_path, destination):
+            return "reflink"
+        
+        if BLOB_STORE_HARDLINKS:
+            try:
+                os.link(blob_path, destination)
+                return "hardlink"
+            except OSError:
+                # Different filesystem or links not supported
+                pass
+        
+        shutil.copyfile(blob_path, destination)
+        return "copy"
+    
+    def _evict_blobs(self):
+        """Evict least recently used blobs until the store fits its quota"""
+        blobs = self.blob_index['blobs']
+        total_size = sum(entry['size'] for entry in blobs.values())
+        for digest in sorted(blobs, key=lambda d: blobs[d].get('last_used', 0)):
+            if total_size <= BLOB_STORE_QUOTA:
+                break
+            total_size -= blobs[digest]['size']
+            self._drop_blob(digest)
+    
+    def fetch_upload(self, file_id: str, file_unique_id: Optional[str], download_path: str) -> Tuple[bool, str]:
+        """Place an uploaded file at download_path, reusing stored content when possible"""
+        temp_path = None
+        local_copy = None  # Content already on disk, used if the store fails
+        try:
+            digest = self.blob_index['file_ids'].get(file_unique_id) if file_unique_id else None
+            if digest and self._blob_is_valid(digest):
+                local_copy = self._blob_path(digest)
+                self.blob_index['blobs'][digest]['last_used'] = time.time()
+                method = self._link_blob(digest, download_path)
+                self._save_blob_index()
+                return True, f"Reused stored upload ({method})"
+            
+            fd, temp_path = tempfile.mkstemp(prefix='.incoming_', dir=self.blob_dir)
+            os.close(fd)
+            success, message = self.download_file(file_id, temp_path)
+            if not success:
+                return False, message
+            local_copy = temp_path
+            
+            digest = self._store_blob(temp_path, file_unique_id)
+            local_copy = self._blob_path(digest)
+            method = self._link_blob(digest, download_path)
+            self._evict_blobs()
+            self._save_blob_index()
+            return True, f"Downloaded ({method})"
+            
+        except Exception as e:
+            if local_copy and os.path.exists(local_copy):
+                self.logger.error(f"Upload store failed, copying local content into place: {e}")
+                try:
+                    shutil.copyfile(local_copy, download_path)
+                    return True, "Downloaded (store bypassed)"
+                except Exception as copy_error:
+                    return False, f"Error saving file: {copy_error}"
+            
+            self.logger.error(f"Upload store failed, falling back to direct download: {e}")
+            return self.download_file(file_id, download_path)
+        
+        finally:
+            # Incoming files are not indexed, so a leftover would escape the quota
+            if temp_path and os.path.exists(temp_path):
+                try:
+                    os.remove(temp_path)
+                except OSError as e:
+                    self.logger.warning(f"Failed to remove incoming upload {temp_path}: {e}")
+    
     def get_updates(self, offset: Optional[int] = None) -> Optional[dict]:
         """Get updates from Telegram"""
         url = f"{self.base_url}/getUpdates"
@@ -213,6 +659,174 @@ class TelegramBot:
         """Set current directory for user"""
         self.user_directories[user_id] = directory
     
+    def _resolve_ioprio_syscall(self):
+        """Resolve ioprio_set for this platform, the stdlib has no wrapper"""
+        syscall_nr = IOPRIO_SYSCALLS.get(platform.machine())
+        if syscall_nr is None or not sys.platform.startswith('linux'):
+            return None
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            return lambda value: libc.syscall(syscall_nr, 1, 0, value)  # IOPRIO_WHO_PROCESS, self
+        except Exception as e:
+            self.logger.warning(f"ionice unavailable: {e}")
+            return None
+    
+    def _write_cgroup_file(self, cgroup_path: str, name: str, value):
+        """Write a value to a cgroup interface file"""
+        with open(os.path.join(cgroup_path, name), 'w') as f:
+            f.write(str(value))
+    
+    def _reserve_bot_resources(self) -> Optional[str]:
+        """Protect the bot process and prepare the cgroup v2 hierarchy for commands"""
+        try:
+            with open('/proc/self/oom_score_adj', 'w') as f:
+                f.write(str(BOT_OOM_SCORE_ADJ))
+        except Exception as e:
+            self.logger.warning(f"Failed to set bot OOM score: {e}")
+        
+        if not CGROUP_ENABLED:
+            return None
+        
+        base = self._get_own_cgroup()
+        if not base:
+            self.logger.warning("cgroup isolation unavailable: bot is not in a cgroup v2 hierarchy")
+            return None
+        
+        try:
+            with open(os.path.join(base, 'cgroup.controllers'), 'r') as f:
+                available = f.read().split()
+        except Exception as e:
+            self.logger.warning(f"cgroup isolation unavailable: {e}")
+            return None
+        controllers = [c for c in ('cpu', 'memory', 'pids') if c in available]
+        if not controllers:
+            self.logger.warning(f"cgroup isolation unavailable: no controllers delegated to {base}")
+            return None
+        
+        # Processes may only live in leaves once controllers are enabled below base,
+        # so the bot moves into its own leaf and moves back if enabling them fails
+        bot_cgroup = os.path.join(base, 'bot')
+        moved = False
+        try:
+            os.makedirs(bot_cgroup, exist_ok=True)
+            self._write_cgroup_file(bot_cgroup, 'cgroup.procs', os.getpid())
+            moved = True
+            self._write_cgroup_file(base, 'cgroup.subtree_control',
+                                    ' '.join(f'+{c}' for c in controllers))
+        except Exception as e:
+            self.logger.warning(f"cgroup isolation unavailable: {e}")
+            try:
+                if moved:
+                    self._write_cgroup_file(base, 'cgroup.procs', os.getpid())
+                os.rmdir(bot_cgroup)
+            except Exception as restore_error:
+                self.logger.error(f"Failed to restore bot cgroup: {restore_error}")
+            return None
+        
+        if 'cpu' in controllers:
+            try:
+                self._write_cgroup_file(bot_cgroup, 'cpu.weight', BOT_CPU_WEIGHT)
+            except Exception as e:
+                self.logger.warning(f"Failed to reserve bot CPU weight: {e}")
+        
+        self.logger.info(f"cgroup isolation enabled: {base} ({', '.join(controllers)})")
+        return base
+    
+    def _get_own_cgroup(self) -> Optional[str]:
+        """Get the cgroup v2 directory the bot process currently belongs to"""
+        try:
+            with open('/proc/self/cgroup', 'r') as f:
+                for line in f:
+                    if line.startswith('0::'):
+                        path = os.path.join(CGROUP_ROOT, line[3:].strip().lstrip('/'))
+                        return path if os.path.isdir(path) else None
+        except Exception as e:
+            self.logger.warning(f"Failed to read own cgroup: {e}")
+        return None
+    
+    def get_command_limits(self, command_class: str, user_id: Optional[int]) -> dict:
+        """Get resource limits for a command class, with per-user overrides applied"""
+        limits = {
+            key: dict(value) if isinstance(value, dict) else value
+            for key, value in COMMAND_LIMITS.get(command_class, {}).items()
+        }
+        overrides = USER_COMMAND_LIMITS.get(user_id, {}).get(command_class, {})
+        for key, value in overrides.items():
+            if isinstance(value, dict):
+                limits.setdefault(key, {}).update(value)
+            else:
+                limits[key] = value
+        return limits
+    
+    def _get_command_cgroup(self, command_class: str, user_id: Optional[int], limits: dict) -> Optional[str]:
+        """Get or create the cgroup shared by a user's commands of one class"""
+        if not self.cgroup_base:
+            return None
+        
+        name = f"{command_class}-{user_id if user_id is not None else 'system'}"
+        if name in self.command_cgroups:
+            return self.command_cgroups[name]
+        
+        cgroup_path = os.path.join(self.cgroup_base, name)
+        try:
+            os.makedirs(cgroup_path, exist_ok=True)
+            for key, value in limits.get('cgroup', {}).items():
+                try:
+                    self._write_cgroup_file(cgroup_path, key, value)
+                except OSError as e:
+                    self.logger.warning(f"Failed to set {key} for cgroup {name}: {e}")
+            self.command_cgroups[name] = cgroup_path
+            return cgroup_path
+        except Exception as e:
+            self.logger.warning(f"Failed to create cgroup {name}: {e}")
+            return None
+    
+    def _make_preexec_fn(self, command_class: str, user_id: Optional[int]):
+        """Build the preexec_fn applying resource limits inside a forked child"""
+        limits = self.get_command_limits(command_class, user_id)
+        cgroup_path = self._get_command_cgroup(command_class, user_id, limits)
+        ioprio_syscall = self._ioprio_syscall
+        
+        # Resolve everything up front, only plain syscalls are safe after fork
+        rlimits = []
+        for name, value in limits.get('rlimits', {}).items():
+            rlimit = getattr(resource, name, None)
+            if rlimit is not None:
+                rlimits.append((rlimit, value if isinstance(value, tuple) else (value, value)))
+        cgroup_procs = os.path.join(cgroup_path, 'cgroup.procs') if cgroup_path else None
+        nice = limits.get('nice')
+        ionice = limits.get('ionice')
+        oom_score_adj = limits.get('oom_score_adj')
+        
+        def preexec():
+            # Errors are ignored, a failing preexec_fn would abort the command
+            if cgroup_procs:
+                try:
+                    with open(cgroup_procs, 'w') as f:
+                        f.write(str(os.getpid()))
+                except OSError:
+                    pass
+            for rlimit, value in rlimits:
+                try:
+                    resource.setrlimit(rlimit, value)
+                except (OSError, ValueError):
+                    pass
+            if nice:
+                try:
+                    os.nice(nice)
+                except OSError:
+                    pass
+            if ionice and ioprio_syscall:
+                ioprio_syscall((ionice[0] << 13) | ionice[1])
+            if oom_score_adj is not None:
+                try:
+                    with open('/proc/self/oom_score_adj', 'w') as f:
+                        f.write(str(oom_score_adj))
+                except OSError:
+                    pass
+        
+        return preexec
+    
     def is_safe_command(self, command: str) -> tuple:
         """Check if command is safe to execute"""
         dangerous_commands = [
@@ -243,7 +857,8 @@ class TelegramBot:
             # Execute command
             result = subprocess.run(
                 command, shell=True, capture_output=True, text=True,
-                cwd=current_dir, timeout=COMMAND_TIMEOUT
+                cwd=current_dir, timeout=COMMAND_TIMEOUT,
+                preexec_fn=self._make_preexec_fn('shell', user_id)
             )
             
             # Combine stdout and stderr
@@ -278,7 +893,8 @@ class TelegramBot:
             
             process = subprocess.Popen(
                 clean_command, shell=True, stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE, text=True, cwd=current_dir
+                stderr=subprocess.PIPE, text=True, cwd=current_dir,
+                preexec_fn=self._make_preexec_fn('background', user_id)
             )
             
             process_id = f"{user_id}_{int(time.time())}"
@@ -317,6 +933,7 @@ class TelegramBot:
         current_dir = self.get_user_directory(user_id)
         
         file_id = file_info['file_id']
+        file_unique_id = file_info.get('file_unique_id')
         file_name = file_info.get('file_name', f"file_{int(time.time())}")
         file_size = file_info.get('file_size', 0)
         
@@ -328,14 +945,15 @@ class TelegramBot:
         
         # Download file to current directory
         download_path = os.path.join(current_dir, file_name)
-        success, message = self.download_file(file_id, download_path)
+        success, message = self.fetch_upload(file_id, file_unique_id, download_path)
         
         if success:
             file_info_text = (
                 f"{EMOJIS['upload']} File uploaded successfully!\n\n"
                 f"📝 *Name:* `{file_name}`\n"
                 f"📊 *Size:* `{file_size} bytes`\n"
-                f"📂 *Location:* `{download_path}`"
+                f"📂 *Location:* `{download_path}`\n"
+                f"🔗 *Transfer:* `{message}`"
             )
             self.send_message(chat_id, file_info_text, reply_to_message_id=message_id)
         else:
@@ -372,6 +990,271 @@ class TelegramBot:
         if not result or not result.get('ok'):
             self.send_message(chat_id, f"{EMOJIS['error']} Failed to send file: `{self.escape_markdown(file_path)}`")
     
+    def resolve_user_path(self, user_id: int, path: str) -> str:
+        """Resolve a path relative to the user's current directory"""
+        if path.startswith('/'):
+            return path
+        return os.path.join(self.get_user_directory(user_id), os.path.expanduser(path))
+    
+    def _open_view_session(self, user_id: int, full_path: str, pattern: Optional[bytes] = None) -> Tuple[int, dict]:
+        """Map a file for paging and register it as a view session"""
+        file = open(full_path, 'rb')
+        try:
+            size = os.fstat(file.fileno()).st_size
+            mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        except Exception:
+            file.close()
+            raise
+        
+        session_id = self.next_view_session_id
+        self.next_view_session_id += 1
+        session = {
+            'user_id': user_id, 'path': full_path, 'file': file, 'mmap': mapping, 'size': size,
+            'regex': re.compile(pattern, re.MULTILINE) if pattern is not None else None,
+            'grep_pages': [0], 'view_page_starts': {}
+        }
+        self.view_sessions[session_id] = session
+        
+        while len(self.view_sessions) > MAX_VIEW_SESSIONS:
+            _, oldest = self.view_sessions.popitem(last=False)
+            self._close_view_session(oldest)
+        
+        return session_id, session
+    
+    def _close_view_session(self, session: dict):
+        """Release the mapping and file handle of a view session"""
+        try:
+            if session['size']:
+                session['mmap'].close()
+            session['file'].close()
+        except Exception as e:
+            self.logger.warning(f"Failed to close view session for {session['path']}: {e}")
+    
+    def _get_view_session(self, session_id: int, user_id: int) -> Optional[dict]:
+        """Get a live view session, dropping it if the file shrank under the mapping"""
+        session = self.view_sessions.get(session_id)
+        if not session or session['user_id'] != user_id:
+            return None
+        
+        # Touching mapped pages past EOF raises SIGBUS, so never read a truncated file
+        try:
+            if os.fstat(session['file'].fileno()).st_size < session['size']:
+                raise ValueError("file was truncated")
+        except Exception:
+            del self.view_sessions[session_id]
+            self._close_view_session(session)
+            return None
+        
+        self.view_sessions.move_to_end(session_id)
+        return session
+    
+    def _read_view_page(self, session: dict, offset: int, page_size: int = VIEW_PAGE_SIZE) -> Tuple[bytes, int]:
+        """Read one page starting at offset, cut at a line boundary"""
+        mapping, size = session['mmap'], session['size']
+        end = min(offset + page_size, size)
+        if end < size:
+            newline = mapping.rfind(b'\n', offset, end)
+            if newline != -1:
+                end = newline + 1
+        return mapping[offset:end], end
+    
+    def _previous_view_offset(self, session: dict, offset: int, page_size: int = VIEW_PAGE_SIZE) -> int:
+        """Find the start of the page preceding offset"""
+        start = max(0, offset - page_size)
+        if start > 0:
+            newline = session['mmap'].find(b'\n', start, offset - 1)
+            if newline != -1:
+                start = newline + 1
+        return start
+    
+    def _line_start(self, session: dict, offset: int) -> int:
+        """Move offset back to the start of its line, scanning at most one page"""
+        if offset <= 0 or offset >= session['size']:
+            return min(max(offset, 0), session['size'])
+        newline = session['mmap'].rfind(b'\n', max(0, offset - VIEW_PAGE_SIZE), offset)
+        return newline + 1 if newline != -1 else offset
+    
+    def _tail_offset(self, session: dict, lines: int) -> int:
+        """Find the offset of the last lines of the file by scanning backwards"""
+        mapping, size = session['mmap'], session['size']
+        if not size:
+            return 0
+        start = size - 1 if mapping[size - 1] == ord('\n') else size
+        for _ in range(lines):
+            start = mapping.rfind(b'\n', 0, start)
+            if start == -1:
+                break
+        return start + 1
+    
+    def _render_view_page(self, session_id: int, session: dict, offset: int,
+                          tail: bool = False) -> Tuple[str, Optional[dict]]:
+        """Render a file page and its Prev/Next keyboard
+
+        With tail set the page ends at EOF and offset is only a lower bound,
+        so the newest lines are always shown.
+        """
+        # Shrink the page when escaping would push it past the message limit
+        page_size = VIEW_PAGE_SIZE
+        tail_start = offset
+        while True:
+            if tail:
+                offset = max(tail_start, self._previous_view_offset(session, session['size'], page_size))
+            data, end = self._read_view_page(session, offset, page_size)
+            content = self.escape_text(data.decode('utf-8', errors='replace').rstrip('\n'))
+            if len(content) <= OUTPUT_PAGE_LENGTH or page_size <= 256:
+                break
+            page_size //= 2
+        
+        file_name = self.escape_text(os.path.basename(session['path']))
+        header = f"{EMOJIS['file']} <code>{file_name}</code> bytes {offset}-{end} of {session['size']}"
+        if content:
+            text = f"{header}\n{self.format_code_block(content, escaped=True)}"
+        else:
+            text = f"{header}\n<i>(empty)</i>"
+        
+        # Remember where each page started so Prev undoes Next exactly, even when
+        # escaping shrank one of the pages
+        session['view_page_starts'][end] = offset
+        
+        buttons = []
+        if offset > 0:
+            previous = session['view_page_starts'].get(offset)
+            if previous is None:
+                previous = self._previous_view_offset(session, offset, page_size)
+            buttons.append({'text': '◀️ Prev', 'callback_data': f"view:{session_id}:{previous}"})
+        if end < session['size']:
+            buttons.append({'text': 'Next ▶️', 'callback_data': f"view:{session_id}:{end}"})
+        return text, {'inline_keyboard': [buttons]} if buttons else None
+    
+    def _grep_search(self, session: dict, pos: int):
+        """Find the next match at or after pos, like grep ignoring the empty tail after a final newline"""
+        mapping, size = session['mmap'], session['size']
+        match = session['regex'].search(mapping, pos)
+        if match and match.start() >= size and mapping[size - 1] == ord('\n'):
+            return None
+        return match
+    
+    def _render_grep_page(self, session_id: int, session: dict, page: int) -> Tuple[str, Optional[dict]]:
+        """Render one page of matching lines and its Prev/Next keyboard"""
+        mapping, size = session['mmap'], session['size']
+        pos = session['grep_pages'][page]
+        lines = []
+        output_size = 0
+        
+        while pos < size and len(lines) < GREP_MAX_MATCHES:
+            match = self._grep_search(session, pos)
+            if not match:
+                pos = size
+                break
+            line_start = mapping.rfind(b'\n', 0, match.start()) + 1
+            line_end = mapping.find(b'\n', match.end())
+            if line_end == -1:
+                line_end = size
+            line = mapping[line_start:line_end][:GREP_MAX_LINE_LENGTH].decode('utf-8', errors='replace')
+            escaped = self.escape_text(f"{line_start}: {line}")
+            if lines and output_size + len(escaped) + 1 > OUTPUT_PAGE_LENGTH:
+                break
+            lines.append(escaped)
+            output_size += len(escaped) + 1
+            pos = line_end + 1
+        
+        # Only offer Next when another match actually follows this page
+        if pos < size and len(session['grep_pages']) == page + 1:
+            match = self._grep_search(session, pos)
+            if match:
+                session['grep_pages'].append(mapping.rfind(b'\n', 0, match.start()) + 1)
+        
+        file_name = self.escape_text(os.path.basename(session['path']))
+        header = f"{EMOJIS['file']} <code>{file_name}</code> matches, page {page + 1}"
+        if lines:
+            text = f"{header}\n{self.format_code_block(chr(10).join(lines), escaped=True)}"
+        else:
+            text = f"{header}\n<i>No matches</i>"
+        
+        buttons = []
+        if page > 0:
+            buttons.append({'text': '◀️ Prev', 'callback_data': f"grep:{session_id}:{page - 1}"})
+        if len(session['grep_pages']) > page + 1:
+            buttons.append({'text': 'Next ▶️', 'callback_data': f"grep:{session_id}:{page + 1}"})
+        return text, {'inline_keyboard': [buttons]} if buttons else None
+    
+    def handle_view_command(self, chat_id: int, user_id: int, args: str, tail: bool = False):
+        """Handle /view and /tail commands"""
+        parts = args.rsplit(None, 1)
+        number = None
+        if len(parts) == 2 and parts[1].isdigit():
+            file_path, number = parts[0], int(parts[1])
+        else:
+            file_path = args
+        
+        full_path = self.resolve_user_path(user_id, file_path)
+        if not os.path.isfile(full_path):
+            self.send_message(chat_id, f"{EMOJIS['error']} File not found: `{self.escape_markdown(file_path)}`")
+            return
+        
+        try:
+            session_id, session = self._open_view_session(user_id, full_path)
+        except Exception as e:
+            self.send_message(chat_id, f"{EMOJIS['error']} Failed to open file: {self.escape_markdown(str(e))}")
+            return
+        
+        if tail:
+            lines = min(max(number or TAIL_DEFAULT_LINES, 1), TAIL_MAX_LINES)
+            offset = self._tail_offset(session, lines)
+        else:
+            offset = self._line_start(session, number or 0)
+        
+        text, keyboard = self._render_view_page(session_id, session, offset, tail=tail)
+        self.send_message(chat_id, text, parse_mode='HTML', reply_markup=keyboard)
+    
+    def handle_grep_command(self, chat_id: int, user_id: int, args: str):
+        """Handle /grep command"""
+        parts = args.rsplit(None, 1)
+        if len(parts) != 2:
+            self.send_message(chat_id, f"{EMOJIS['error']} Usage: `/grep <pattern> <file>`")
+            return
+        pattern, file_path = parts
+        
+        full_path = self.resolve_user_path(user_id, file_path)
+        if not os.path.isfile(full_path):
+            self.send_message(chat_id, f"{EMOJIS['error']} File not found: `{self.escape_markdown(file_path)}`")
+            return
+        
+        try:
+            session_id, session = self._open_view_session(user_id, full_path, pattern.encode())
+        except re.error as e:
+            self.send_message(chat_id, f"{EMOJIS['error']} Invalid pattern: {self.escape_markdown(str(e))}")
+            return
+        except Exception as e:
+            self.send_message(chat_id, f"{EMOJIS['error']} Failed to open file: {self.escape_markdown(str(e))}")
+            return
+        
+        if not session['size']:
+            text, keyboard = f"{EMOJIS['file']} <code>{self.escape_text(os.path.basename(full_path))}</code> is empty", None
+        else:
+            text, keyboard = self._render_grep_page(session_id, session, 0)
+        self.send_message(chat_id, text, parse_mode='HTML', reply_markup=keyboard)
+    
+    def handle_view_callback(self, callback_query: dict, kind: str, session_id: int, position: int):
+        """Handle Prev/Next buttons of the file viewer"""
+        message = callback_query['message']
+        session = self._get_view_session(session_id, callback_query['from']['id'])
+        if not session:
+            self.answer_callback_query(callback_query['id'], "Session expired, run the command again")
+            return
+        
+        if kind == 'grep':
+            if not 0 <= position < len(session['grep_pages']):
+                self.answer_callback_query(callback_query['id'])
+                return
+            text, keyboard = self._render_grep_page(session_id, session, position)
+        else:
+            text, keyboard = self._render_view_page(session_id, session, min(max(position, 0), session['size']))
+        
+        self.edit_message_text(message['chat']['id'], message['message_id'], text,
+                               parse_mode='HTML', reply_markup=keyboard)
+        self.answer_callback_query(callback_query['id'])
+    
     def add_bot_script(self, script_content: str, script_name: str = None) -> Tuple[bool, str]:
         """Add a new bot script"""
         try:
@@ -394,7 +1277,8 @@ class TelegramBot:
         except Exception as e:
             return False, f"{EMOJIS['error']} Failed to add bot script: {str(e)}"
     
-    def run_bot_script(self, script_name: str, bot_token: str = None) -> Tuple[bool, str]:
+    def run_bot_script(self, script_name: str, bot_token: str = None,
+                       user_id: Optional[int] = None) -> Tuple[bool, str]:
         """Run a bot script"""
         try:
             script_path = os.path.join(self.scripts_dir, script_name)
@@ -410,7 +1294,8 @@ class TelegramBot:
             # Start the script
             process = subprocess.Popen(
                 ['python3', script_path], stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE, text=True, env=env, cwd=os.path.dirname(script_path)
+                stderr=subprocess.PIPE, text=True, env=env, cwd=os.path.dirname(script_path),
+                preexec_fn=self._make_preexec_fn('bot_script', user_id)
             )
             
             bot_id = f"bot_{int(time.time())}"
@@ -441,7 +1326,7 @@ class TelegramBot:
             script_match = re.search(r'bot_script_\w+\.py', message)
             if script_match:
                 script_name = script_match.group()
-                success, run_message = self.run_bot_script(script_name, self.token)
+                success, run_message = self.run_bot_script(script_name, self.token, user_id)
                 self.send_message(chat_id, run_message)
     
     def list_bots(self) -> str:
@@ -571,6 +1456,9 @@ class TelegramBot:
             "• `/stopbot <id>` — stop running bot\n"
             "• `/install <package>` — install package\n"
             "• `/sysinfo` — show system information\n"
+            "• `/view <file> [offset]` — page through a file\n"
+            "• `/tail <file> [n]` — show last lines of a file\n"
+            "• `/grep <pattern> <file>` — search a file\n"
             "• `pwd` — show current directory\n"
             "• `cd <path>` — change directory\n\n"
             f"{EMOJIS['upload']} *File Operations:*\n"
@@ -592,6 +1480,9 @@ class TelegramBot:
             "• `ls` — list files and directories\n\n"
             "*File Operations:*\n"
             "• `cat <file>` — display file contents\n"
+            "• `/view <file> [offset]` — page through large files\n"
+            "• `/tail <file> [n]` — show last n lines\n"
+            "• `/grep <pattern> <file>` — show matching lines\n"
             "• `mkdir <dir>` — create directory\n"
             "• `rm <file>` — remove file\n"
             "• `cp <src> <dst>` — copy file\n"
@@ -670,6 +1561,12 @@ class TelegramBot:
             package_name = text[9:].strip()
             success, message_text = self.install_package(package_name)
             self.send_message(chat_id, message_text)
+        elif text.startswith('/view '):
+            self.handle_view_command(chat_id, user_id, text[6:].strip())
+        elif text.startswith('/tail '):
+            self.handle_view_command(chat_id, user_id, text[6:].strip(), tail=True)
+        elif text.startswith('/grep '):
+            self.handle_grep_command(chat_id, user_id, text[6:].strip())
         elif text.startswith('/sysinfo'):
             info = self.get_system_info()
             if info:
@@ -691,11 +1588,31 @@ class TelegramBot:
             success, output = self.execute_command(text, current_dir, user_id)
             
             if success:
-                escaped_output = self.escape_markdown(output)
-                self.send_message(chat_id, f"```\n{escaped_output}\n```")
+                self.send_command_output(chat_id, user_id, text, output)
             else:
                 self.send_message(chat_id, output)
     
+    def process_callback_query(self, callback_query: dict):
+        """Process inline keyboard button presses"""
+        data = callback_query.get('data', '')
+        if 'message' not in callback_query:
+            self.answer_callback_query(callback_query['id'])
+            return
+        
+        try:
+            kind, session_id, position = data.split(':')
+            session_id, position = int(session_id), int(position)
+        except ValueError:
+            self.answer_callback_query(callback_query['id'])
+            return
+        
+        if kind in ('view', 'grep'):
+            self.handle_view_callback(callback_query, kind, session_id, position)
+        elif kind == 'out':
+            self.handle_output_callback(callback_query, session_id, position)
+        else:
+            self.answer_callback_query(callback_query['id'])
+    
     def run(self):
         """Main bot loop"""
         self.logger.info("🤖 Telegram Remote System Administration Bot is running...")
@@ -716,6 +1633,10 @@ class TelegramBot:
                 for update in updates.get('result', []):
                     offset = update['update_id'] + 1
                     
+                    if 'callback_query' in update:
+                        self.process_callback_query(update['callback_query'])
+                        continue
+                    
                     if 'message' not in update:
                         continue
                     